@@ -4,44 +4,83 @@ Contém a lógica para os cálculos físicos, definição dos presets e a visual
 """
 
 import os
+import math
 import numpy as np
-from numba import njit
+from numba import cuda, float64, njit, prange
 from vispy import app, scene
 from vispy.visuals.filters import Alpha, ColorFilter
 
 # Constantes físicas e parâmetros de simulação
 k_e = 8.988e9  # Constante de Coulomb
 default_dt = 0.005  # Intervalo de tempo padrão
+eps2 = 1e-28  # Distância ao quadrado mínima para considerar um par de cargas
+max_trail_len = 2000  # Número máximo de posições guardadas por trajetória
+specialize_max_n = 32  # Até este número de cargas usa kernels especializados por N
+cuda_min_n = 512  # A partir deste número de cargas usa a GPU, se disponível
+cuda_threads = 128  # Threads por bloco (e tamanho do bloco em memória compartilhada)
 
-# Define o tipo de dado para as cargas (posição, velocidade, carga, massa e estado ativo)
-charge_dtype = np.dtype(
-    [
-        ("pos", np.float64, 3),  # Posição (x, y, z)
-        ("vel", np.float64, 3),  # Velocidade (vx, vy, vz)
-        ("q", np.float64),  # Carga elétrica
-        ("m", np.float64),  # Massa
-        ("active", np.bool_),  # Indica se a carga está ativa
-    ]
+# Assinatura dos kernels de passo (ver ChargeSimulation.step)
+step_signature = (
+    "void(float64[:, ::1], float64[:, ::1], float64[::1], float64[::1],"
+    " boolean[::1], float64, UniTuple(float64, 2))"
 )
 
-# Presets para diferentes arranjos de partículas
-preset_configs = [
-    {
-        "name": "Orbital",
-        "charges": np.array(
+
+# Presets para diferentes arranjos de partículas. Cada preset é uma função que
+# gera arrays novos (pos, vel, q, m, active, colors) e só é chamada ao carregar
+# o preset, em vez de montar todos os arranjos na importação do módulo.
+def _around_center(ring_pos, ring_vel, ring_q, ring_m, ring_color):
+    # Monta um sistema com uma carga central positiva seguida das cargas dadas
+    n = len(ring_pos)
+    pos = np.empty((n + 1, 3))
+    pos[0] = 5.0
+    pos[1:] = ring_pos
+    vel = np.zeros((n + 1, 3))
+    vel[1:] = ring_vel
+    colors = np.empty((n + 1, 4), dtype=np.float32)
+    colors[0] = [1.0, 0.8, 0.0, 0.9]  # Central: dourado
+    colors[1:] = ring_color
+    return {
+        "pos": pos,
+        "vel": vel,
+        "q": np.concatenate([[+8e-6], np.full(n, ring_q)]),
+        "m": np.concatenate([[5e-2], np.full(n, ring_m)]),
+        "active": np.ones(n + 1, dtype=np.bool_),
+        "colors": colors,
+    }
+
+
+def make_orbital():
+    return {
+        "pos": np.array(
             [
-                ([5.0, 5.0, 5.0], [0.0, 0.0, 0.0], +8e-6, 5e-2, True),
-                ([7.0, 5.0, 5.0], [0.0, 40.0, 0.0], -2e-6, 1e-3, True),
-                ([3.0, 5.0, 5.0], [0.0, -40.0, 0.0], -2e-6, 1e-3, True),
-                ([7.5, 7.5, 5.0], [-4.242, 4.242, 0.0], -3e-6, 3e-3, True),
-                ([2.5, 7.5, 5.0], [-4.242, -4.242, 0.0], -3e-6, 3e-3, True),
-                ([2.5, 2.5, 5.0], [4.242, -4.242, 0.0], -3e-6, 3e-3, True),
-                ([7.5, 2.5, 5.0], [4.242, 4.242, 0.0], -3e-6, 3e-3, True),
-                ([7.0, 5.0, 7.0], [4.242, 0.0, -4.242], +4e-6, 4e-3, True),
-                ([3.0, 5.0, 3.0], [-4.242, 0.0, 4.242], +4e-6, 4e-3, True),
-            ],
-            dtype=charge_dtype,
+                [5.0, 5.0, 5.0],
+                [7.0, 5.0, 5.0],
+                [3.0, 5.0, 5.0],
+                [7.5, 7.5, 5.0],
+                [2.5, 7.5, 5.0],
+                [2.5, 2.5, 5.0],
+                [7.5, 2.5, 5.0],
+                [7.0, 5.0, 7.0],
+                [3.0, 5.0, 3.0],
+            ]
+        ),
+        "vel": np.array(
+            [
+                [0.0, 0.0, 0.0],
+                [0.0, 40.0, 0.0],
+                [0.0, -40.0, 0.0],
+                [-4.242, 4.242, 0.0],
+                [-4.242, -4.242, 0.0],
+                [4.242, -4.242, 0.0],
+                [4.242, 4.242, 0.0],
+                [4.242, 0.0, -4.242],
+                [-4.242, 0.0, 4.242],
+            ]
         ),
+        "q": np.array([+8e-6, -2e-6, -2e-6, -3e-6, -3e-6, -3e-6, -3e-6, +4e-6, +4e-6]),
+        "m": np.array([5e-2, 1e-3, 1e-3, 3e-3, 3e-3, 3e-3, 3e-3, 4e-3, 4e-3]),
+        "active": np.ones(9, dtype=np.bool_),
         "colors": np.array(
             [
                 [1.0, 0.8, 0.0, 0.9],  # Central: dourado
@@ -56,16 +95,16 @@ preset_configs = [
             ],
             dtype=np.float32,
         ),
-    },
-    {
-        "name": "Dipole",
-        "charges": np.array(
-            [
-                ([4.0, 5.0, 5.0], [0.0, 0.0, 0.0], +5e-6, 1e-2, True),
-                ([6.0, 5.0, 5.0], [0.0, 0.0, 0.0], -5e-6, 1e-2, True),
-            ],
-            dtype=charge_dtype,
-        ),
+    }
+
+
+def make_dipole():
+    return {
+        "pos": np.array([[4.0, 5.0, 5.0], [6.0, 5.0, 5.0]]),
+        "vel": np.zeros((2, 3)),
+        "q": np.array([+5e-6, -5e-6]),
+        "m": np.array([1e-2, 1e-2]),
+        "active": np.ones(2, dtype=np.bool_),
         "colors": np.array(
             [
                 [1.0, 0.0, 0.0, 0.9],
@@ -73,115 +112,60 @@ preset_configs = [
             ],
             dtype=np.float32,
         ),
-    },
-    {
-        "name": "Ring",
-        "charges": np.array(
-            [
-                ([5.0, 5.0, 5.0], [0.0, 0.0, 0.0], +8e-6, 5e-2, True),
-                *[
-                    (
-                        [5.0 + 3 * np.cos(theta), 5.0 + 3 * np.sin(theta), 5.0],
-                        [0.0, 0.0, 0.0],
-                        -1e-6,
-                        1e-3,
-                        True,
-                    )
-                    for theta in np.linspace(0, 2 * np.pi, 8, endpoint=False)
-                ],
-            ],
-            dtype=charge_dtype,
-        ),
-        "colors": np.array(
-            [
-                [1.0, 0.8, 0.0, 0.9],
-                *[[0.0, 1.0, 0.0, 0.8]] * 8,
-            ],
-            dtype=np.float32,
-        ),
-    },
-    {
-        "name": "Ellipse",
-        "charges": np.array(
-            [([5.0, 5.0, 5.0], [0.0, 0.0, 0.0], +8e-6, 5e-2, True)]
-            + [
-                (
-                    [5.0 + 5 * np.cos(theta), 5.0 + 3 * np.sin(theta), 5.0],
-                    [-3 * np.sin(theta), 2 * np.cos(theta), 0.0],
-                    -1e-6,
-                    1e-3,
-                    True,
-                )
-                for theta in np.linspace(0, 2 * np.pi, 12, endpoint=False)
-            ],
-            dtype=charge_dtype,
-        ),
-        "colors": np.array(
-            [[1.0, 0.8, 0.0, 0.9]] + [[0.2, 0.7, 1.0, 0.8] for _ in range(12)],
-            dtype=np.float32,
-        ),
-    },
-    {
-        "name": "Spiral",
-        "charges": np.array(
-            [([5.0, 5.0, 5.0], [0.0, 0.0, 0.0], +8e-6, 5e-2, True)]
-            + [
-                (
-                    [5.0 + theta * np.cos(theta), 5.0 + theta * np.sin(theta), 5.0],
-                    [-np.sin(theta), np.cos(theta), 0.0],
-                    -1e-6,
-                    1e-3,
-                    True,
-                )
-                for theta in np.linspace(0.5, 3 * np.pi, 15)
-            ],
-            dtype=charge_dtype,
-        ),
-        "colors": np.array(
-            [[1.0, 0.8, 0.0, 0.9]] + [[0.9, 0.3, 0.7, 0.8] for _ in range(15)],
-            dtype=np.float32,
-        ),
-    },
-    {
-        "name": "Random Scatter",
-        "charges": np.array(
-            [
-                # Generate 20 charges scattered randomly in a cube and set random velocities
-                *[
-                    (
-                        [
-                            5.0 + 4 * (np.random.rand() - 0.5),
-                            5.0 + 4 * (np.random.rand() - 0.5),
-                            5.0 + 4 * (np.random.rand() - 0.5),
-                        ],
-                        [
-                            2 * (np.random.rand() - 0.5),
-                            2 * (np.random.rand() - 0.5),
-                            2 * (np.random.rand() - 0.5),
-                        ],
-                        (-1e-6 if np.random.rand() > 0.5 else +1e-6),
-                        1e-3,
-                        True,
-                    )
-                    for _ in range(20)
-                ],
-            ],
-            dtype=charge_dtype,
-        ),
-        "colors": np.array(
-            [*([[np.random.rand(), np.random.rand(), np.random.rand(), 0.8]] * 20)],
-            dtype=np.float32,
-        ),
-    },
-    {
-        "name": "Stable Binary",
-        "charges": np.array(
-            [
-                ([4.5, 5.0, 5.0], [0.0, 5.0, 0.0], +4e-6, 1e-2, True),
-                ([5.5, 5.0, 5.0], [0.0, -5.0, 0.0], -4e-6, 1e-2, True),
-            ],
-            dtype=charge_dtype,
-        ),
+    }
+
+
+def make_ring():
+    theta = np.linspace(0, 2 * np.pi, 8, endpoint=False)
+    ring_pos = np.stack(
+        [5.0 + 3 * np.cos(theta), 5.0 + 3 * np.sin(theta), np.full(8, 5.0)], axis=1
+    )
+    return _around_center(ring_pos, 0.0, -1e-6, 1e-3, [0.0, 1.0, 0.0, 0.8])
+
+
+def make_ellipse():
+    theta = np.linspace(0, 2 * np.pi, 12, endpoint=False)
+    ring_pos = np.stack(
+        [5.0 + 5 * np.cos(theta), 5.0 + 3 * np.sin(theta), np.full(12, 5.0)], axis=1
+    )
+    ring_vel = np.stack([-3 * np.sin(theta), 2 * np.cos(theta), np.zeros(12)], axis=1)
+    return _around_center(ring_pos, ring_vel, -1e-6, 1e-3, [0.2, 0.7, 1.0, 0.8])
+
+
+def make_spiral():
+    theta = np.linspace(0.5, 3 * np.pi, 15)
+    ring_pos = np.stack(
+        [
+            5.0 + theta * np.cos(theta),
+            5.0 + theta * np.sin(theta),
+            np.full(15, 5.0),
+        ],
+        axis=1,
+    )
+    ring_vel = np.stack([-np.sin(theta), np.cos(theta), np.zeros(15)], axis=1)
+    return _around_center(ring_pos, ring_vel, -1e-6, 1e-3, [0.9, 0.3, 0.7, 0.8])
+
+
+def make_random_scatter():
+    # Gera 20 cargas espalhadas aleatoriamente num cubo, com velocidades aleatórias
+    n = 20
+    return {
+        "pos": 5.0 + 4 * (np.random.rand(n, 3) - 0.5),
+        "vel": 2 * (np.random.rand(n, 3) - 0.5),
+        "q": np.where(np.random.rand(n) > 0.5, -1e-6, +1e-6),
+        "m": np.full(n, 1e-3),
+        "active": np.ones(n, dtype=np.bool_),
+        "colors": np.tile(np.append(np.random.rand(3), 0.8).astype(np.float32), (n, 1)),
+    }
+
+
+def make_stable_binary():
+    return {
+        "pos": np.array([[4.5, 5.0, 5.0], [5.5, 5.0, 5.0]]),
+        "vel": np.array([[0.0, 5.0, 0.0], [0.0, -5.0, 0.0]]),
+        "q": np.array([+4e-6, -4e-6]),
+        "m": np.array([1e-2, 1e-2]),
+        "active": np.ones(2, dtype=np.bool_),
         "colors": np.array(
             [
                 [1.0, 0.3, 0.3, 1.0],
@@ -189,32 +173,76 @@ preset_configs = [
             ],
             dtype=np.float32,
         ),
-    },
-    {
-        "name": "Stable Circular",
-        "charges": np.array(
-            [([5.0, 5.0, 5.0], [0.0, 0.0, 0.0], +8e-6, 5e-2, True)]
-            + [
-                (
-                    [5.0 + 3 * np.cos(theta), 5.0 + 3 * np.sin(theta), 5.0],
-                    [-3 * np.sin(theta) * 2, 3 * np.cos(theta) * 2, 0.0],
-                    -1e-6,
-                    1e-3,
-                    True,
-                )
-                for theta in np.linspace(0, 2 * np.pi, 4, endpoint=False)
-            ],
-            dtype=charge_dtype,
-        ),
-        "colors": np.array(
-            [[1.0, 0.8, 0.0, 0.9]] + [[0.0, 1.0, 1.0, 0.8]] * 4,
-            dtype=np.float32,
-        ),
-    },
+    }
+
+
+def make_stable_circular():
+    theta = np.linspace(0, 2 * np.pi, 4, endpoint=False)
+    ring_pos = np.stack(
+        [5.0 + 3 * np.cos(theta), 5.0 + 3 * np.sin(theta), np.full(4, 5.0)], axis=1
+    )
+    ring_vel = np.stack(
+        [-3 * np.sin(theta) * 2, 3 * np.cos(theta) * 2, np.zeros(4)], axis=1
+    )
+    return _around_center(ring_pos, ring_vel, -1e-6, 1e-3, [0.0, 1.0, 1.0, 0.8])
+
+
+preset_configs = [
+    ("Orbital", make_orbital),
+    ("Dipole", make_dipole),
+    ("Ring", make_ring),
+    ("Ellipse", make_ellipse),
+    ("Spiral", make_spiral),
+    ("Random Scatter", make_random_scatter),
+    ("Stable Binary", make_stable_binary),
+    ("Stable Circular", make_stable_circular),
     # Outros presets podem ser adicionados aqui...
 ]
 
 
+@njit(fastmath=True, boundscheck=False, cache=True)
+def _integrate(pos, vel, m, forces, active, dt, boundary):
+    # Atualiza velocidade e posição a partir das forças (usado pelos kernels
+    # de passo) e desativa as partículas que saírem dos limites definidos
+    lo = boundary[0]
+    hi = boundary[1]
+    for i in range(pos.shape[0]):
+        for d in range(3):
+            vel[i, d] += forces[i, d] / m[i] * dt
+            pos[i, d] += vel[i, d] * dt
+        x = pos[i, 0]
+        y = pos[i, 1]
+        z = pos[i, 2]
+        if x < lo or y < lo or z < lo or x > hi or y > hi or z > hi:
+            active[i] = False
+
+
+def make_step(n):
+    # Gera um kernel de passo (mesma física de ChargeSimulation.step) para
+    # exatamente n cargas. n é uma constante de compilação, o que permite ao
+    # LLVM desenrolar os laços de presets pequenos
+    @njit(step_signature, fastmath=True, boundscheck=False, cache=True)
+    def step_n(pos, vel, q, m, active, dt, boundary):
+        forces = np.zeros((n, 3), dtype=np.float64)
+        for i in range(n):
+            for j in range(n):
+                rx = pos[j, 0] - pos[i, 0]
+                ry = pos[j, 1] - pos[i, 1]
+                rz = pos[j, 2] - pos[i, 2]
+                dist2 = rx * rx + ry * ry + rz * rz
+                # O próprio i (dist2 = 0) e cargas sobrepostas não contribuem
+                if dist2 < eps2:
+                    continue
+                inv = 1.0 / (dist2 * math.sqrt(dist2))
+                force_mag = k_e * q[i] * q[j] * inv
+                forces[i, 0] += force_mag * rx
+                forces[i, 1] += force_mag * ry
+                forces[i, 2] += force_mag * rz
+        _integrate(pos, vel, m, forces, active, dt, boundary)
+
+    return step_n
+
+
 # Classe principal que gerencia a simulação
 class ChargeSimulation:
     def __init__(self):
@@ -222,26 +250,88 @@ class ChargeSimulation:
         self.dt = default_dt
         self.presets = preset_configs
         self.current_preset = 0
-        self.charges = self.presets[self.current_preset]["charges"].copy()
-        self.colors = self.presets[self.current_preset]["colors"].copy()
-        # Armazena as trajetórias (lista de posições para cada partícula)
-        self.trajectories = [[] for _ in range(len(self.charges))]
+        # Kernels especializados por número de cargas (ver make_step)
+        self._step_cache = {}
+        self._load_preset()
+        self._reset_trajectories()
         self.running = False  # Inicia a simulação pausada
+        self.physics_substeps = 4  # Passos de física por tick do timer
+        self.render_every = 1  # Envia dados à GPU a cada render_every ticks
+        self._frame = 0
 
         # Configura os elementos visuais
         self.setup_visuals()
         self._update_visuals_initial()
 
-    def _update_visuals_initial(self):
-        # Increase the base size to have larger particles initially
+    def _load_preset(self):
+        # Gera os arrays do preset atual (estrutura de arrays)
+        _, make_preset = self.presets[self.current_preset]
+        config = make_preset()
+        self.pos = np.ascontiguousarray(config["pos"], dtype=np.float64)
+        self.vel = np.ascontiguousarray(config["vel"], dtype=np.float64)
+        self.q = np.ascontiguousarray(config["q"], dtype=np.float64)
+        self.m = np.ascontiguousarray(config["m"], dtype=np.float64)
+        self.active = np.ascontiguousarray(config["active"], dtype=np.bool_)
+        self.colors = np.ascontiguousarray(config["colors"], dtype=np.float32)
+        # Cópia float32 das posições, usada apenas para enviar dados à GPU
+        self._pos_f32 = np.empty((len(self.q), 3), dtype=np.float32)
+        # Massas e cores não mudam até o próximo reset: pré-calcula o que é
+        # usado a cada quadro na renderização
         base_size = 20  # increased base size
-        # Also, increase the additional size term for mass effect
-        mass_sizes = base_size + 40 * (self.charges["m"] / self.charges["m"].max())
+        self._mass_sizes = base_size + 40 * (self.m / self.m.max())
+        self._face_colors = (self.colors * 0.7).astype(np.float32)
+        # Presets pequenos usam um kernel especializado para o seu N. Para
+        # muitas cargas o laço O(N²) das forças vai para a GPU, quando houver
+        n = len(self.q)
+        if n >= cuda_min_n and cuda.is_available():
+            self._step = self._step_cuda
+        elif n <= specialize_max_n:
+            self._step = self._step_specialized
+        else:
+            self._step = self.step
+        # Aquece o kernel escolhido (compilação, cache em disco, pool de
+        # threads) com dt = 0 sobre cópias, para não travar o primeiro quadro
+        self._step(
+            self.pos.copy(),
+            self.vel.copy(),
+            self.q,
+            self.m,
+            self.active.copy(),
+            0.0,
+            (-100000.0, 100000.0),
+        )
+
+    def _reset_trajectories(self):
+        # Armazena as trajetórias num buffer circular preenchido em dobro: cada
+        # posição é escrita em head e head + max_trail_len, de modo que as
+        # últimas traj_len posições formem sempre uma fatia contígua e ordenada
+        self.traj = np.empty((len(self.q), 2 * max_trail_len, 3), dtype=np.float32)
+        self.traj_len = 0
+        self.traj_head = 0
+
+        # Comprimento de trajetória para o qual as cores e a conexão da linha
+        # foram enviadas pela última vez
+        self._drawn_trail_len = 0
+
+    def _trails(self):
+        # Retorna (sem cópia) as trajetórias (N, traj_len, 3), da mais antiga à atual
+        start = (self.traj_head - self.traj_len) % max_trail_len
+        return self.traj[:, start : start + self.traj_len]
+
+    def _trail_connect(self, n_trail):
+        # Conecta cada vértice ao seguinte, exceto na fronteira entre a
+        # trajetória de uma partícula e a da próxima
+        connect = np.ones(len(self.q) * n_trail, dtype=bool)
+        connect[n_trail - 1 :: n_trail] = False
+        return connect[:-1]
+
+    def _update_visuals_initial(self):
+        np.copyto(self._pos_f32, self.pos, casting="same_kind")
         self.particles.set_data(
-            self.charges["pos"],
+            self._pos_f32,
             edge_color=self.colors,
-            face_color=self.colors * 0.7,
-            size=mass_sizes,
+            face_color=self._face_colors,
+            size=self._mass_sizes,
             edge_width=1.5,
         )
 
@@ -266,91 +356,222 @@ class ChargeSimulation:
         self.particles.attach(ColorFilter((1, 1, 1, 1)))
         self.particles.attach(Alpha(1))
 
-        # Cria linhas para desenhar trajetórias de cada partícula
-        self.traj_lines = [
-            scene.visuals.Line(
-                color=color, width=4, method="gl", parent=self.view.scene
-            )
-            for color in self.colors
-        ]
+        # Cria uma única linha que desenha as trajetórias de todas as partículas
+        self.traj_line = scene.visuals.Line(
+            width=4, method="gl", parent=self.view.scene
+        )
 
         # Timer para atualização contínua da simulação
         self.timer = app.Timer(interval="auto", connect=self.update)
 
     @staticmethod
-    @njit
-    def compute_forces(charges):
-        # Calcula as forças de Coulomb entre todas as cargas ativas
-        n = len(charges)
+    @njit(
+        # Assinatura fixa: compila ao importar e reutiliza o cache entre execuções
+        step_signature,
+        parallel=True,
+        fastmath=True,
+        boundscheck=False,
+        cache=True,
+    )
+    def step(pos, vel, q, m, active, dt, boundary):
+        # Avança um passo: calcula as forças de Coulomb entre as cargas e, em
+        # seguida, atualiza velocidade e posição no próprio array. Todas as
+        # cargas recebidas são tratadas como ativas (ver _advance); active só
+        # é escrito para marcar as que saírem dos limites.
+        # Cada linha i de forces é escrita por uma única thread (prange), por
+        # isso o par (i, j) é avaliado nos dois sentidos em vez de usar a 3ª lei.
+        # A força de i é acumulada em variáveis locais e escrita uma única vez.
+        n = pos.shape[0]
         forces = np.zeros((n, 3), dtype=np.float64)
-        for i in range(n):
-            if not charges[i]["active"]:
-                continue
-            for j in range(i + 1, n):
-                if not charges[j]["active"]:
+        for i in prange(n):
+            xi = pos[i, 0]
+            yi = pos[i, 1]
+            zi = pos[i, 2]
+            qi = q[i]
+            fx = 0.0
+            fy = 0.0
+            fz = 0.0
+            for j in range(n):
+                rx = pos[j, 0] - xi
+                ry = pos[j, 1] - yi
+                rz = pos[j, 2] - zi
+                dist2 = rx * rx + ry * ry + rz * rz
+                # O próprio i (dist2 = 0) e cargas sobrepostas não contribuem
+                if dist2 < eps2:
                     continue
-                r = charges[j]["pos"] - charges[i]["pos"]
-                dist = np.sqrt(r[0] ** 2 + r[1] ** 2 + r[2] ** 2) + 1e-14
-                force_mag = k_e * charges[i]["q"] * charges[j]["q"] / dist**3
-                forces[i] += force_mag * r
-                forces[j] -= force_mag * r
-        return forces
+                inv = 1.0 / (dist2 * math.sqrt(dist2))
+                force_mag = k_e * qi * q[j] * inv
+                fx += force_mag * rx
+                fy += force_mag * ry
+                fz += force_mag * rz
+            forces[i, 0] = fx
+            forces[i, 1] = fy
+            forces[i, 2] = fz
+
+        _integrate(pos, vel, m, forces, active, dt, boundary)
+
+    @staticmethod
+    def _integrate_np(pos, vel, m, forces, active, dt, boundary):
+        # Atualiza velocidade e posição a partir das forças, vetorizado (usado
+        # pelo passo em GPU, cujas forças voltam para a CPU)
+        vel += forces / m[:, None] * dt
+        pos += vel * dt
+        # Se a partícula sair dos limites definidos, desativa-a
+        outside = (pos.min(axis=1) < boundary[0]) | (pos.max(axis=1) > boundary[1])
+        active[outside] = False
+
+    @staticmethod
+    @cuda.jit
+    def _force_kernel(pos, q, forces):
+        # Uma thread por carga i; as cargas j são lidas em blocos de
+        # cuda_threads posições carregados na memória compartilhada
+        sh_pos = cuda.shared.array((cuda_threads, 3), dtype=float64)
+        sh_q = cuda.shared.array(cuda_threads, dtype=float64)
+        n = pos.shape[0]
+        i = cuda.grid(1)
+        tx = cuda.threadIdx.x
+        xi = 0.0
+        yi = 0.0
+        zi = 0.0
+        qi = 0.0
+        if i < n:
+            xi = pos[i, 0]
+            yi = pos[i, 1]
+            zi = pos[i, 2]
+            qi = q[i]
+        fx = 0.0
+        fy = 0.0
+        fz = 0.0
+        for jj in range(0, n, cuda_threads):
+            j = jj + tx
+            if j < n:
+                sh_pos[tx, 0] = pos[j, 0]
+                sh_pos[tx, 1] = pos[j, 1]
+                sh_pos[tx, 2] = pos[j, 2]
+                sh_q[tx] = q[j]
+            else:
+                # Posições além de n não exercem força
+                sh_pos[tx, 0] = xi
+                sh_pos[tx, 1] = yi
+                sh_pos[tx, 2] = zi
+                sh_q[tx] = 0.0
+            cuda.syncthreads()
+            for k in range(cuda_threads):
+                rx = sh_pos[k, 0] - xi
+                ry = sh_pos[k, 1] - yi
+                rz = sh_pos[k, 2] - zi
+                dist2 = rx * rx + ry * ry + rz * rz
+                # O próprio i (dist2 = 0) e cargas sobrepostas não contribuem
+                if dist2 >= eps2:
+                    inv = 1.0 / (dist2 * math.sqrt(dist2))
+                    force_mag = k_e * qi * sh_q[k] * inv
+                    fx += force_mag * rx
+                    fy += force_mag * ry
+                    fz += force_mag * rz
+            cuda.syncthreads()
+        if i < n:
+            forces[i, 0] = fx
+            forces[i, 1] = fy
+            forces[i, 2] = fz
 
     @staticmethod
-    @njit
-    def update_physics(charges, forces, dt, boundary):
-        # Atualiza a posição e velocidade das partículas de acordo com a física
-        for i in range(len(charges)):
-            if charges[i]["active"]:
-                charges["vel"][i] += forces[i] / charges[i]["m"] * dt
-                charges["pos"][i] += charges["vel"][i] * dt
-                # Se a partícula sair dos limites definidos, desativa-a
-                if np.any(charges["pos"][i] < boundary[0]) or np.any(
-                    charges["pos"][i] > boundary[1]
-                ):
-                    charges["active"][i] = False
+    def _step_cuda(pos, vel, q, m, active, dt, boundary):
+        # Mesmo passo que step, mas com as forças calculadas na GPU
+        n = pos.shape[0]
+        d_forces = cuda.device_array((n, 3), dtype=np.float64)
+        blockspergrid = (n + cuda_threads - 1) // cuda_threads
+        ChargeSimulation._force_kernel[blockspergrid, cuda_threads](
+            cuda.to_device(pos), cuda.to_device(q), d_forces
+        )
+        forces = d_forces.copy_to_host()
+        ChargeSimulation._integrate_np(pos, vel, m, forces, active, dt, boundary)
+
+    def _specialized_step(self, n):
+        # Retorna o kernel para n cargas, gerando-o na primeira vez
+        kernel = self._step_cache.get(n)
+        if kernel is None:
+            kernel = self._step_cache[n] = make_step(n)
+        return kernel
+
+    def _step_specialized(self, pos, vel, q, m, active, dt, boundary):
+        # O kernel especializado só vale para o N do preset; depois que _advance
+        # compacta as cargas ativas, usa o kernel genérico (já compilado)
+        if pos.shape[0] == len(self.q):
+            kernel = self._specialized_step(pos.shape[0])
+        else:
+            kernel = self.step
+        kernel(pos, vel, q, m, active, dt, boundary)
+
+    def _advance(self, boundary=(-100000.0, 100000.0)):
+        # Executa um passo de física apenas sobre as cargas ativas. Quando há
+        # cargas desativadas, compacta as ativas em arrays densos para que o
+        # kernel não precise testar active a cada par
+        if self.active.all():
+            self._step(
+                self.pos, self.vel, self.q, self.m, self.active, self.dt, boundary
+            )
+            return
+        idx = np.flatnonzero(self.active)
+        if len(idx) == 0:
+            return
+        pos_a = self.pos[idx]
+        vel_a = self.vel[idx]
+        active_a = np.ones(len(idx), dtype=np.bool_)
+        self._step(pos_a, vel_a, self.q[idx], self.m[idx], active_a, self.dt, boundary)
+        self.pos[idx] = pos_a
+        self.vel[idx] = vel_a
+        self.active[idx] = active_a
 
     def update(self, event):
         # Atualiza o estado da simulação a cada quadro
         if not self.running:
             return
 
-        forces = self.compute_forces(self.charges)
-        self.update_physics(self.charges, forces, self.dt, boundary=(-100000, 100000))
+        for _ in range(self.physics_substeps):
+            self._advance()
+
+            # Armazena a posição atual de cada partícula na respectiva trajetória
+            self.traj[:, self.traj_head] = self.pos
+            self.traj[:, self.traj_head + max_trail_len] = self.pos
+            self.traj_head = (self.traj_head + 1) % max_trail_len
+            self.traj_len = min(self.traj_len + 1, max_trail_len)
 
-        # Armazena a posição atual de cada partícula na respectiva trajetória
-        for i in range(len(self.charges)):
-            self.trajectories[i].append(self.charges["pos"][i].copy())
+        # Só atualiza os visuais a cada render_every ticks
+        self._frame += 1
+        if self._frame % self.render_every != 0:
+            return
 
-        # Atualiza visualmente os marcadores das partículas, considerando massa e velocidade
-        base_size = 20  # increased base size in update as well
-        mass_sizes = base_size + 40 * (self.charges["m"] / self.charges["m"].max())
-        velocities = np.linalg.norm(self.charges["vel"], axis=1)
-        v_norm = velocities / (velocities.max() + 1e-14)
+        # Atualiza visualmente os marcadores das partículas, considerando a massa
+        np.copyto(self._pos_f32, self.pos, casting="same_kind")
         self.particles.set_data(
-            self.charges["pos"],
+            self._pos_f32,
             edge_color=self.colors,
-            face_color=self.colors * 0.7,
-            size=mass_sizes,
-            
+            face_color=self._face_colors,
+            size=self._mass_sizes,
             edge_width=1.5,
         )
-
-        # Atualiza as trajetórias visuais com mudança gradual de opacidade
-        for i, line in enumerate(self.traj_lines):
-            trail_pos = np.array(self.trajectories[i])
-            if len(trail_pos) > 0:
-                alphas = np.linspace(0.1, 0.6, len(trail_pos))
-                trail_colors = np.ones((len(trail_pos), 4)) * self.colors[i]
-                trail_colors[:, 3] = alphas
-                line.set_data(trail_pos, color=trail_colors)
-                line.visible = True
+        # Atualiza as trajetórias visuais com mudança gradual de opacidade,
+        # enviando todas as partículas à GPU numa única chamada
+        n_trail = self.traj_len
+        if n_trail > 1:
+            trail_pos = self._trails().reshape(-1, 3)
+            if n_trail != self._drawn_trail_len:
+                # Cores e conexão só dependem do comprimento da trajetória: são
+                # refeitas enquanto ela cresce e depois reaproveitadas pela GPU
+                trail_colors = np.repeat(self.colors, n_trail, axis=0)
+                alphas = np.linspace(0.1, 0.6, n_trail)
+                trail_colors[:, 3] = np.tile(alphas, len(self.q))
+                self.traj_line.set_data(
+                    trail_pos,
+                    color=trail_colors,
+                    connect=self._trail_connect(n_trail),
+                )
+                self._drawn_trail_len = n_trail
             else:
-                # Ensure that the line remains hidden with a dummy point to avoid empty arrays.
-                dummy_pos = np.zeros((1, 3))
-                dummy_color = np.zeros((1, 4))
-                line.set_data(dummy_pos, color=dummy_color)
-                line.visible = False
+                self.traj_line.set_data(trail_pos)
+            self.traj_line.visible = True
+        else:
+            self.traj_line.visible = False
 
         self.canvas.update()
 
@@ -358,16 +579,9 @@ class ChargeSimulation:
         # Reinicia os atributos da simulação: cargas, trajetórias e cores
         if preset_index is not None:
             self.current_preset = preset_index
-        self.charges = self.presets[self.current_preset]["charges"].copy()
-        self.colors = self.presets[self.current_preset]["colors"].copy()
-        self.trajectories = [[] for _ in range(len(self.charges))]
-        # Reinitialize trajectory lines so that their number matches the current charges
-        self.traj_lines = [
-            scene.visuals.Line(
-                color=color, width=4, method="gl", parent=self.view.scene
-            )
-            for color in self.colors
-        ]
+        self._load_preset()
+        self._reset_trajectories()
+        self.traj_line.visible = False
         self._update_visuals_initial()
 
 
@@ -49,7 +49,7 @@ class MainWindow(QMainWindow):
 
         # Combobox para seleção de presets
         self.preset_combo = QComboBox()
-        self.preset_combo.addItems([p["name"] for p in self.sim.presets])
+        self.preset_combo.addItems([name for name, _ in self.sim.presets])
         self.preset_combo.setStyleSheet("color: white;")  # Set font color to white
         self.preset_combo.currentIndexChanged.connect(self.load_preset)
         control_layout.addWidget(self.preset_combo)